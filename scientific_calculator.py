@@ -1,8 +1,28 @@
 import streamlit as st
 import numpy as np
 import math
+import threading
+from collections import deque
+from typing import Final
 from scipy import integrate
-from sympy import sympify, lambdify, SympifyError
+from tokenize import TokenError
+from sympy import lambdify, sympify, SympifyError, Symbol, S, Add, Mul, Pow, preorder_traversal
+from sympy.parsing.sympy_parser import parse_expr, standard_transformations, convert_xor
+from sympy.utilities.autowrap import autowrap, CodeWrapError
+from sympy.utilities.codegen import CodeGenArgumentListError
+
+# SymEngine is optional; its C++ core parses and differentiates faster than SymPy
+try:
+    import symengine as sym_backend
+except ImportError:
+    import sympy as sym_backend
+
+# numba is optional; without it integrands are called back into Python
+try:
+    import numba
+    from scipy import LowLevelCallable
+except ImportError:
+    numba = None
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -13,7 +33,10 @@ st.set_page_config(
 )
 
 # --- Custom CSS for better button styling ---
-st.markdown("""
+@st.cache_resource
+def _get_css():
+    """Returns the stylesheet, built once per server instead of on every rerun"""
+    return """
 <style>
 /* Style for calculator buttons */
 .stButton > button {
@@ -125,44 +148,376 @@ div[data-testid="stButton"] button[kind="primary"]:hover {
     background: linear-gradient(135deg, #5a67d8 0%, #6b46c1 100%) !important;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_get_css(), unsafe_allow_html=True)
+
+# --- Button Layout ---
+# Calculator Buttons with uniform symbols
+BUTTONS: Final = [
+    ('7', '8', '9', '➗'),
+    ('4', '5', '6', '✖️'),
+    ('1', '2', '3', '➖'),
+    ('0', '(', ')', '➕'),
+    ('.', 'C', '⌫', '=')
+]
+
+# Updated key mapping
+KEY_MAP: Final = {
+    '➕': 'plus', '➖': 'minus', '➗': 'divide', '✖️': 'multiply',
+    '=': 'equals', '⌫': 'backspace', '.': 'dot', '(': 'open_paren',
+    ')': 'close_paren', 'C': 'clear'
+}
+
+# Symbol mapping for calculation
+SYMBOL_MAP: Final = {
+    '➕': '+',
+    '➖': '-',
+    '➗': '/',
+    '✖️': '*',
+    '⌫': '<-'
+}
+
+# Scientific function buttons
+FUNC_BUTTONS: Final = [
+    ('sin()', 'cos()', 'tan()'),
+    ('asin()', 'acos()', 'atan()'),
+    ('log()', 'ln()', 'sqrt()'),
+    ('exp()', 'π', 'e'),
+    ('abs()', 'n!', '^')
+]
+
+# Number of calculations kept in the history sidebar
+MAX_HISTORY: Final = 100
+
+# Parser transformations; convert_xor keeps sympify's reading of ^ as power
+PARSE_TRANSFORMATIONS: Final = standard_transformations + (convert_xor,)
 
 # --- Helper Functions ---
 
-def safe_eval(expr_str, local_dict):
+def _extra_symbols(sympy_expr, var_str):
+    """Returns the names of the free symbols in an expression other than var_str"""
+    return sorted({str(s) for s in sympy_expr.free_symbols} - {var_str})
+
+def _parse(func_str, var, numeric=True, evaluate=False):
     """
-    Safely evaluates a string expression using a dictionary of allowed functions.
-    Uses SymPy's lambdify for safe and efficient evaluation.
+    Parses a function of var. With numeric=True, as needed for compiling,
+    other free symbols are rejected and numeric constants are hoisted.
+    Symbolic work such as differentiation needs evaluate=True, since unevaluated
+    forms like log(x, 2) differentiate incorrectly.
+    Returns the SymPy expression and the variable's Symbol.
     """
-    try:
-        # 1. Sympify the expression to convert it into a SymPy object
-        sympy_expr = sympify(expr_str)
+    x = Symbol(var)
+    sympy_expr = parse_expr(func_str, local_dict={var: x}, transformations=PARSE_TRANSFORMATIONS,
+                            evaluate=evaluate)
+    if numeric:
+        extra = _extra_symbols(sympy_expr, var)
+        if extra:
+            raise ValueError(f"expression depends on {', '.join(extra)} as well as {var}")
+        sympy_expr = hoist_constants(sympy_expr)
+    return sympy_expr, x
+
+@st.cache_resource(max_entries=128)
+def _cached_lambdify(expr_str, var_str, modules):
+    """
+    Compiles an expression string into a callable, cached across reruns.
+    Keyed by strings only, so identical inputs always hit the same entry.
+    With var_str the expression is a function of that variable, otherwise
+    its free symbols become the arguments. modules 'calculator' resolves to
+    the allowed functions backed by numpy.
+    Returns the lambdified function and the names of its arguments.
+    """
+    if var_str:
+        sympy_expr, x = _parse(expr_str, var_str)
+        symbols = [x]
+    else:
+        # Evaluate while parsing, as sympify did, so sqrt(-1) becomes I rather than nan
+        sympy_expr = parse_expr(expr_str, transformations=PARSE_TRANSFORMATIONS)
+        symbols = sorted(sympy_expr.free_symbols, key=str)
+    if modules == 'calculator':
+        modules = [allowed_funcs, 'numpy']
+    func = lambdify(symbols, sympy_expr, modules=modules, cse=bool(var_str))
+    return func, tuple(str(s) for s in symbols)
+
+def safe_eval(expr_str):
+    """
+    Safely evaluates a string expression using the allowed functions and constants.
+    Pure-numeric input is evaluated directly against the allowed names;
+    anything else, including results numpy cannot represent as a finite real
+    (such as sqrt(-1)), falls back to SymPy's lambdify.
+    """
+    # Fast path: no builtins and no dunder access, only the allowed names
+    if "__" not in expr_str:
+        try:
+            with np.errstate(all='ignore'):
+                result = eval(expr_str, {"__builtins__": {}}, allowed_funcs)
+            if isinstance(result, int) or (np.isrealobj(result) and np.all(np.isfinite(result))):
+                return result
+        except (NameError, SyntaxError, TypeError, ValueError, ZeroDivisionError, OverflowError):
+            pass
 
-        # 2. Get all symbols (variables) from the expression
-        symbols = sympy_expr.free_symbols
+    try:
+        # 1. Canonicalize the expression so "1+2" and "1 + 2" share a cache entry
+        cache_key = "".join(expr_str.split())
 
-        # 3. Create a callable function from the SymPy expression
-        # This function will take the symbol values as arguments
-        func = lambdify(symbols, sympy_expr, modules=[local_dict, 'numpy'])
+        # 2. Fetch (or build once) the callable and the names of its free symbols
+        func, symbol_names = _cached_lambdify(cache_key, '', 'calculator')
 
-        # 4. Prepare the arguments for the function
+        # 3. Prepare the arguments for the function
         # For a basic calculator, we expect no free variables, so this should be empty
-        args = {str(s): local_dict.get(str(s), 0) for s in symbols}
+        args = {name: allowed_funcs.get(name, 0) for name in symbol_names}
 
         return func(**args)
-    except (SympifyError, NameError, TypeError, SyntaxError) as e:
+    except (SympifyError, TokenError, NameError, TypeError, SyntaxError, ValueError, ZeroDivisionError) as e:
         st.error("❌ Invalid Expression")
         return None
 
+def hoist_constants(sympy_expr):
+    """
+    Collapses numeric subexpressions such as sin(pi/4) into float constants,
+    so they are not recomputed on every call of the generated function.
+    Pure-numeric expressions are left exact. 17 significant digits round-trip
+    a double exactly, so the printed constants lose no accuracy.
+    """
+    if sympy_expr.free_symbols:
+        return sympy_expr.evalf(17)
+    return sympy_expr
+
+@st.cache_resource(max_entries=64)
+def get_integrand(func_str, var):
+    """
+    Returns the integrand for integrate.quad, JIT-compiled with numba when possible.
+    A numba cfunc lets quad sample the function without a Python round-trip.
+    Falls back to the plain Python callable if numba is missing or cannot compile it.
+    Returns (integrand, cfunc); the cfunc owns the compiled code behind the
+    LowLevelCallable's pointer, so it is cached alongside it (None on fallback).
+    """
+    f, _ = _cached_lambdify(func_str, var, 'math')
+    if numba is None:
+        return f, None
+    try:
+        cf = numba.cfunc("float64(float64)")(f)
+        return LowLevelCallable(cf.ctypes), cf
+    except Exception:
+        # Some lambdified expressions cannot be lowered by numba
+        return f, None
+
+@st.cache_resource
+def _cython_available():
+    """Checks once per server whether autowrap's Cython backend can be imported"""
+    try:
+        import Cython  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+@st.cache_resource
+def _autowrap_lock():
+    """
+    Process-wide lock around autowrap, which calls os.chdir, edits sys.path and
+    numbers its modules without locking. Sessions run as threads of one process,
+    and a plain module-level lock would be re-created on every script rerun.
+    """
+    return threading.Lock()
+
+@st.cache_resource(max_entries=32)
+def get_autowrapped(func_str, var):
+    """
+    Compiles the integrand to native code with autowrap's Cython backend.
+    The first compile takes around a second; the cache makes later integrations
+    of the same integrand run at native speed per sample.
+    Returns (function, None), or (None, reason) if it cannot be compiled; the
+    failure is cached too, so a missing toolchain is not retried on every click.
+    """
+    sympy_func, x = _parse(func_str, var)
+    if not _cython_available():
+        return None, "Cython is not installed"
+    try:
+        with _autowrap_lock():
+            return autowrap(sympy_func, args=[x], backend='cython'), None
+    except (CodeWrapError, CodeGenArgumentListError, ImportError) as e:
+        return None, str(e)
+
+# Fixed-order Gauss-Legendre rules for the fast integration mode; the
+# lower-order rule provides the error estimate and the smoothness check
+_GL_NODES, _GL_WEIGHTS = np.polynomial.legendre.leggauss(20)
+_GL_NODES_LOW, _GL_WEIGHTS_LOW = np.polynomial.legendre.leggauss(10)
+
+def gauss_legendre(func_str, var, a, b):
+    """
+    Integrates with a fixed 20-point Gauss-Legendre rule in one vectorized call.
+    Returns (result, error), the error being the difference from a 10-point rule,
+    or None if the two rules disagree and the adaptive quad should be used instead.
+    """
+    f, _ = _cached_lambdify(func_str, var, 'numpy')
+    half_width, mid = 0.5 * (b - a), 0.5 * (a + b)
+
+    try:
+        with np.errstate(all='ignore'):
+            xs = half_width * _GL_NODES + mid
+            result = half_width * np.sum(_GL_WEIGHTS * np.broadcast_to(f(xs), xs.shape))
+            xs_low = half_width * _GL_NODES_LOW + mid
+            result_low = half_width * np.sum(_GL_WEIGHTS_LOW * np.broadcast_to(f(xs_low), xs_low.shape))
+    except NameError:
+        # A function numpy cannot resolve; let quad report it
+        return None
+
+    error = abs(result - result_low)
+    if not np.isfinite(result) or error > 1e-8 * max(1.0, abs(result)):
+        return None
+    return float(result), float(error)
+
+# Functions whose expressions are handed to SymEngine; anything else (re, im, arg, ...)
+# stays in SymPy, since SymEngine crashes the process on some of their derivatives
+_SYMENGINE_FUNCS: Final = frozenset({
+    "sin", "cos", "tan", "asin", "acos", "atan", "sinh", "cosh", "tanh", "exp", "log"
+})
+
+def _symengine_safe(sympy_expr):
+    """Checks that an expression uses only arithmetic, numbers, pi, e and whitelisted functions"""
+    for node in preorder_traversal(sympy_expr):
+        if node.is_Symbol or node.is_Number or node in (S.Pi, S.Exp1) or isinstance(node, (Add, Mul, Pow)):
+            continue
+        if type(node).__name__ not in _SYMENGINE_FUNCS:
+            return False
+    return True
+
+def _symengine_lambdify(x, expr):
+    """
+    Compiles a SymEngine expression of x into a scalar callable,
+    JIT-compiled with LLVM if SymEngine was built with it.
+    """
+    try:
+        fn = sym_backend.Lambdify([x], [expr], backend='llvm')
+    except Exception:
+        fn = sym_backend.Lambdify([x], [expr])
+    return lambda value: float(np.ravel(fn(value))[0])
+
+def _subs_evaluator(x, derivative_expr):
+    """Evaluates a derivative symbolically at a point through subs().evalf()"""
+    return lambda value: derivative_expr.subs(x, value).evalf()
+
+def _with_subs_fallback(x, derivative_expr, f_prime):
+    """
+    Wraps a compiled derivative so that anything other than a finite real result
+    (math errors such as 1/x at 0, complex values, unresolved names) falls back
+    to symbolic evaluation through subs().evalf(), e.g. giving zoo or -0.5*I.
+    """
+    def evaluate(value):
+        try:
+            result = f_prime(value)
+        except (NameError, ZeroDivisionError, ValueError, OverflowError):
+            return _subs_evaluator(x, derivative_expr)(value)
+        if isinstance(result, complex) or not math.isfinite(result):
+            return _subs_evaluator(x, derivative_expr)(value)
+        return result
+    return evaluate
+
+@st.cache_resource(max_entries=64)
+def get_derivative(func_str, var):
+    """
+    Differentiates a single-variable function once per (function, variable) pair.
+    Returns the parsed function, its derivative and a callable for fast numeric
+    evaluation of the derivative at a point. Uses SymEngine with an LLVM-compiled
+    Lambdify when available, otherwise SymPy with a 'math'-backed lambdify.
+    Input is always parsed by SymPy, so the accepted grammar does not depend on
+    whether SymEngine is installed.
+    """
+    sympy_func, x = _parse(func_str, var, numeric=False, evaluate=True)
+
+    if (sym_backend.__name__ == 'symengine' and not _extra_symbols(sympy_func, var)
+            and _symengine_safe(sympy_func)):
+        try:
+            se_x = sym_backend.Symbol(var)
+            derivative_expr = sym_backend.sympify(sympy_func).diff(se_x)
+            # Same contract as the SymPy path: non-finite results (nan for sqrt(-1),
+            # inf for 1/0) are re-evaluated symbolically
+            f_prime = _with_subs_fallback(x, sympify(derivative_expr), _symengine_lambdify(se_x, derivative_expr))
+            return sympy_func, derivative_expr, f_prime
+        except Exception:
+            # Expressions SymEngine cannot convert or compile go through SymPy below
+            pass
+
+    derivative_expr = sympy_func.diff(x)
+    if _extra_symbols(derivative_expr, var):
+        # Other symbols remain, so the value at the point is itself symbolic
+        return sympy_func, derivative_expr, _subs_evaluator(x, derivative_expr)
+    try:
+        f_prime, _ = _cached_lambdify(str(derivative_expr), var, 'math')
+    except (SyntaxError, TokenError, NameError, TypeError, ValueError, NotImplementedError):
+        # The derivative does not round-trip through its string form, or contains
+        # terms such as Derivative(re(x), x) (from abs(x)) that lambdify cannot print
+        return sympy_func, derivative_expr, _subs_evaluator(x, derivative_expr)
+    return sympy_func, derivative_expr, _with_subs_fallback(x, derivative_expr, f_prime)
+
+@st.cache_resource(max_entries=32)
+def get_derivative_ufunc(func_str, var):
+    """
+    Returns a derivative evaluator that broadcasts over NumPy arrays.
+    With numba available the derivative is compiled once into a parallel ufunc;
+    otherwise a 'numpy'-backed lambdify is used.
+    """
+    _, derivative_expr, _ = get_derivative(func_str, var)
+    extra = _extra_symbols(derivative_expr, var)
+    if extra:
+        raise ValueError(f"derivative depends on {', '.join(extra)} as well as {var}")
+    if numba is not None:
+        try:
+            # Always a SymPy 'math' lambdify, even when get_derivative used SymEngine,
+            # since numba cannot compile SymEngine's Lambdify objects
+            f_math, _ = _cached_lambdify(str(derivative_expr), var, 'math')
+            f = numba.njit(f_math)
+            return numba.vectorize([numba.float64(numba.float64)], target='parallel')(lambda x: f(x))
+        except Exception:
+            # Fall back below if numba cannot lower the derivative
+            pass
+    try:
+        vf, _ = _cached_lambdify(str(derivative_expr), var, 'numpy')
+    except NotImplementedError:
+        raise ValueError(f"derivative {derivative_expr} cannot be evaluated numerically")
+    return vf
+
+# Single-codepoint operator translations; ✖️ carries a variation selector
+# (U+FE0F) so it is replaced separately in the functions below
+_DISPLAY_TRANS = str.maketrans({'➕': '+', '➖': '-', '➗': '÷'})
+_EVAL_TRANS = str.maketrans({'π': 'pi', '➕': '+', '➖': '-', '➗': '/', '^': '**'})
+
+@st.cache_data(max_entries=64)
 def transform_display(expression):
     """Converts emoji operators to standard math symbols for display"""
-    return (
-        expression
-        .replace('➕', '+')
-        .replace('➖', '-')
-        .replace('✖️', '×')
-        .replace('➗', '÷')
-    )
+    return expression.translate(_DISPLAY_TRANS).replace('✖️', '×')
+
+@st.cache_data(max_entries=64)
+def render_display(expression):
+    """Builds the display HTML for an expression, memoized across reruns"""
+    return f"<div class='calculator-display'>{transform_display(expression)}</div>"
+
+def to_eval_expr(expression):
+    """Converts emoji operators and symbols to Python operators for evaluation"""
+    return expression.translate(_EVAL_TRANS).replace('✖️', '*')
+
+def press_key(label):
+    """
+    Button callback for the number pad. Streamlit reruns once the callback
+    returns, so the display picks up the new expression without st.rerun().
+    """
+    if label == 'C':
+        st.session_state.expression = ""
+    elif label == '⌫':
+        st.session_state.expression = st.session_state.expression[:-1]
+    else:
+        st.session_state.expression += label
+
+def press_function(label):
+    """Button callback for the scientific function buttons"""
+    if label == 'π':
+        st.session_state.expression += 'π'
+    elif label == 'n!':
+        st.session_state.expression += 'factorial('
+    elif '()' in label:
+        st.session_state.expression += label[:-1]
+    else:
+        st.session_state.expression += label
 
 # --- UI Layout ---
 st.title("🧮 Scientific Calculator")
@@ -170,87 +525,78 @@ st.markdown("Use the buttons below and write mathematical expression. For calcul
 
 # --- Session State for History ---
 if 'history' not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = deque(maxlen=MAX_HISTORY)
 if 'expression' not in st.session_state:
     st.session_state.expression = ""
 
 # --- Main Calculator Interface ---
+# Factorials for the common small-n case, looked up instead of computed
+_FACT: Final = tuple(math.factorial(n) for n in range(21))
+
+def _factorial(n):
+    """Factorial using the precomputed table for integral 0 <= n <= 20"""
+    if 0 <= n <= 20 and n == int(n):
+        return _FACT[int(n)]
+    return math.factorial(n)
+
 # Dictionary of allowed functions and constants for safe evaluation
-allowed_funcs = {
-    "sin": np.sin, "cos": np.cos, "tan": np.tan,
-    "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan,
-    "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
-    "log": np.log10, "ln": np.log,
-    "sqrt": np.sqrt, "exp": np.exp,
-    "pi": np.pi, "e": np.e,
-    "abs": np.abs,
-    "factorial": math.factorial
-}
+@st.cache_resource
+def _get_funcs():
+    """Returns the allowed functions and constants, built once per server"""
+    return {
+        "sin": np.sin, "cos": np.cos, "tan": np.tan,
+        "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan,
+        "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
+        "log": np.log10, "ln": np.log,
+        "sqrt": np.sqrt, "exp": np.exp,
+        "pi": np.pi, "e": np.e,
+        "abs": np.abs,
+        "factorial": _factorial
+    }
+
+allowed_funcs = _get_funcs()
+
+# --- Cache Warm-up ---
+@st.cache_resource
+def _warm():
+    """
+    Precompiles the default calculus inputs and their derivatives once per server,
+    so the first click on the default expressions does not pay compile latency.
+    Covers the quad integrand (including its numba cfunc), the numpy variant
+    used by fast mode, and the point derivative.
+    """
+    for func_str, var in [("x**2", "x"), ("sin(x)", "x"), ("cos(x)", "x"), ("exp(x)", "x")]:
+        get_integrand(func_str, var)
+        _cached_lambdify(func_str, var, 'numpy')
+        get_derivative(func_str, var)
+
+_warm()
 
 # Display area with better styling
 st.markdown("### Current Expression:")
-display_expr = st.session_state.expression if st.session_state.expression else "0"
-display_expr = transform_display(display_expr)  # Apply transformation
-st.markdown(f"<div class='calculator-display'>{display_expr}</div>", unsafe_allow_html=True)
+display_ph = st.empty()
+display_ph.markdown(render_display(st.session_state.expression or "0"), unsafe_allow_html=True)
 
 st.markdown("---")
 
-# Calculator Buttons with uniform symbols
-buttons = [
-    ('7', '8', '9', '➗'),
-    ('4', '5', '6', '✖️'),
-    ('1', '2', '3', '➖'),
-    ('0', '(', ')', '➕'),
-    ('.', 'C', '⌫', '=')
-]
-
-# Updated key mapping
-key_map = {
-    '➕': 'plus', '➖': 'minus', '➗': 'divide', '✖️': 'multiply',
-    '=': 'equals', '⌫': 'backspace', '.': 'dot', '(': 'open_paren',
-    ')': 'close_paren', 'C': 'clear'
-}
-
-# Symbol mapping for calculation
-symbol_map = {
-    '➕': '+',
-    '➖': '-',
-    '➗': '/',
-    '✖️': '*',
-    '⌫': '<-'
-}
-
-for row in buttons:
+for row in BUTTONS:
     cols = st.columns(4)
     for i, label in enumerate(row):
         # Create a safe key for the button
-        safe_key = f"btn_{key_map.get(label, label)}"
-
-        if cols[i].button(label, use_container_width=True, key=safe_key):
-            if label == '=':
-                if st.session_state.expression:
-                    # Replace symbols for calculation
-                    eval_expr = st.session_state.expression
-                    # Replace π with pi for calculation, factorial( is already correct
-                    eval_expr = eval_expr.replace('π', 'pi')
-                    # Replace emoji symbols with actual operators for evaluation
-                    eval_expr = eval_expr.replace('➕', '+').replace('➖', '-')
-                    eval_expr = eval_expr.replace('➗', '/').replace('✖️', '*').replace('^', '**')
-
-                    result = safe_eval(eval_expr, allowed_funcs)
-                    if result is not None:
-                        st.session_state.history.append(f"{transform_display(st.session_state.expression)} = {result}")
-                        st.session_state.expression = str(result)
-                        st.rerun()
-            elif label == 'C':
-                st.session_state.expression = ""
-                st.rerun()
-            elif label == '⌫':
-                st.session_state.expression = st.session_state.expression[:-1]
-                st.rerun()
-            else:
-                st.session_state.expression += label
-                st.rerun()
+        safe_key = f"btn_{KEY_MAP.get(label, label)}"
+
+        if label != '=':
+            cols[i].button(label, use_container_width=True, key=safe_key, on_click=press_key, args=(label,))
+        elif cols[i].button(label, use_container_width=True, key=safe_key):
+            if st.session_state.expression:
+                # Replace symbols for calculation, factorial( is already correct
+                eval_expr = to_eval_expr(st.session_state.expression)
+
+                result = safe_eval(eval_expr)
+                if result is not None:
+                    st.session_state.history.append(f"{transform_display(st.session_state.expression)} = {result}")
+                    st.session_state.expression = str(result)
+                    st.rerun()
 
 # --- Advanced Functions Sections ---
 st.markdown("---")
@@ -258,94 +604,173 @@ st.header("🔬 Advanced Operations")
 
 # --- Scientific Functions Expander ---
 with st.expander("📐 Trigonometric & Logarithmic Functions"):
-    func_buttons = [
-        ('sin()', 'cos()', 'tan()'),
-        ('asin()', 'acos()', 'atan()'),
-        ('log()', 'ln()', 'sqrt()'),
-        ('exp()', 'π', 'e'),
-        ('abs()', 'n!', '^')
-    ]
-    for row in func_buttons:
+    for row in FUNC_BUTTONS:
         cols = st.columns(3)
         for i, label in enumerate(row):
-            if cols[i].button(label, use_container_width=True, key=f"func_btn_{label}"):
-                if label == 'π':
-                    st.session_state.expression += 'π'
-                elif label == 'n!':
-                    st.session_state.expression += 'factorial('
-                elif '()' in label:
-                    insert_text = label[:-1]
-                    st.session_state.expression += insert_text
-                else:
-                    st.session_state.expression += label
-                st.rerun()
+            cols[i].button(label, use_container_width=True, key=f"func_btn_{label}",
+                           on_click=press_function, args=(label,))
 
 # --- Calculus Section ---
-with st.expander("🧠 Calculus: Integration & Differentiation"):
-    st.subheader("∫ Definite Integration")
-
-    col_int1, col_int2 = st.columns(2)
-    func_str_int = col_int1.text_input("Function f(x)", "x**2", help="Enter a function of x. Use ** for power.")
-    variable_int = col_int2.text_input("Variable", "x", max_chars=1, help="The variable of integration.", key="var_int")
-
-    col_lim1, col_lim2 = st.columns(2)
-    lower_limit = col_lim1.number_input("Lower Limit (a)", value=0.0, format="%.4f")
-    upper_limit = col_lim2.number_input("Upper Limit (b)", value=1.0, format="%.4f")
+def _stored_output(key, inputs):
+    """
+    Returns the output saved under key by the last calculation, or None (clearing it)
+    once any of the inputs it was computed from has changed
+    """
+    saved = st.session_state.get(key)
+    if saved is None or saved[0] != inputs:
+        st.session_state[key] = None
+        return None
+    return saved[1]
 
-    if st.button("Calculate Integral", use_container_width=True, type="primary"):
-        try:
-            x = sympify(variable_int)
-            sympy_func = sympify(func_str_int)
-            f = lambdify(x, sympy_func, 'numpy')
-            result, error = integrate.quad(f, lower_limit, upper_limit)
+@st.fragment
+def _calculus_fragment():
+    """
+    Calculus widgets; interacting with them reruns only this fragment.
+    A successful calculation stores its output in session state, keyed by its
+    inputs, and reruns the whole app so the sidebar history picks up the new entry.
+    """
+    with st.expander("🧠 Calculus: Integration & Differentiation"):
+        st.subheader("∫ Definite Integration")
+
+        col_int1, col_int2 = st.columns(2)
+        func_str_int = col_int1.text_input("Function f(x)", "x**2", help="Enter a function of x. Use ** for power.")
+        variable_int = col_int2.text_input("Variable", "x", max_chars=1, help="The variable of integration.", key="var_int")
+
+        col_lim1, col_lim2 = st.columns(2)
+        lower_limit = col_lim1.number_input("Lower Limit (a)", value=0.0, format="%.4f")
+        upper_limit = col_lim2.number_input("Upper Limit (b)", value=1.0, format="%.4f")
+        fast_mode = st.checkbox("Fast mode", help="Use a fixed 20-point Gauss-Legendre rule for smooth integrands. "
+                                                  "Falls back to adaptive quadrature when it is not accurate enough.")
+        compile_mode = st.checkbox("Compile (fast, slow first call)",
+                                   help="Compile the integrand to native code with Cython before integrating. "
+                                        "Skipped when numba already compiles it.")
+
+        integral_inputs = (func_str_int, variable_int, lower_limit, upper_limit)
+        if st.button("Calculate Integral", use_container_width=True, type="primary"):
+            warning = note = None
+            try:
+                fast_result = None
+                if fast_mode:
+                    fast_result = gauss_legendre(func_str_int, variable_int, lower_limit, upper_limit)
+
+                if fast_result is not None:
+                    result, error = fast_result
+                else:
+                    f, cf = get_integrand(func_str_int, variable_int)
+                    # A numba cfunc already runs natively inside quad, so autowrap is only
+                    # worth it when the integrand would otherwise be interpreted
+                    if compile_mode and cf is not None:
+                        note = "ℹ️ numba already compiled this integrand to native code, so the Cython compile was skipped."
+                    elif compile_mode:
+                        compiled, reason = get_autowrapped(func_str_int, variable_int)
+                        if compiled is not None:
+                            f = compiled
+                        else:
+                            warning = f"⚠️ Compilation failed, using the interpreted integrand: {reason}"
+                    result, error = integrate.quad(f, lower_limit, upper_limit)
+
+                st.session_state.integral_output = (integral_inputs, (result, error, warning, note))
+                st.session_state.history.append(f"∫({func_str_int}) from {lower_limit} to {upper_limit} = {result}")
+                st.rerun()
 
+            except (SympifyError, TokenError, SyntaxError, TypeError, ValueError, ZeroDivisionError, NameError) as e:
+                st.session_state.integral_output = None
+                st.error(f"❌ Error in integration: {e}")
+
+        integral_output = _stored_output('integral_output', integral_inputs)
+        if integral_output:
+            result, error, warning, note = integral_output
+            if warning:
+                st.warning(warning)
+            if note:
+                st.info(note)
             st.success(f"✅ Result: {result}")
             st.info(f"📊 Estimated Error: {error}")
-            st.session_state.history.append(f"∫({func_str_int}) from {lower_limit} to {upper_limit} = {result}")
 
-        except (SympifyError, TypeError, ValueError) as e:
-            st.error(f"❌ Error in integration: {e}")
+        st.markdown("---")
+        st.subheader("d/dx Differentiation")
 
-    st.markdown("---")
-    st.subheader("d/dx Differentiation")
+        col_diff1, col_diff2 = st.columns(2)
+        func_str_diff = col_diff1.text_input("Function f(x)", "sin(x)", help="Enter a function of x. Use ** for power.")
+        variable_diff = col_diff2.text_input("Variable", "x", max_chars=1, help="The variable of differentiation.",
+                                             key="var_diff")
 
-    col_diff1, col_diff2 = st.columns(2)
-    func_str_diff = col_diff1.text_input("Function f(x)", "sin(x)", help="Enter a function of x. Use ** for power.")
-    variable_diff = col_diff2.text_input("Variable", "x", max_chars=1, help="The variable of differentiation.",
-                                         key="var_diff")
+        eval_point = st.number_input("Point (x)", value=0.0, format="%.4f",
+                                     help="The point at which to evaluate the derivative.")
 
-    eval_point = st.number_input("Point (x)", value=0.0, format="%.4f",
-                                 help="The point at which to evaluate the derivative.")
+        derivative_inputs = (func_str_diff, variable_diff, eval_point)
+        if st.button("Calculate Derivative", use_container_width=True, type="primary"):
+            try:
+                x_sym = Symbol(variable_diff)
+                sympy_func, derivative_expr, f_prime = get_derivative(func_str_diff, variable_diff)
+                result = f_prime(eval_point)
 
-    if st.button("Calculate Derivative", use_container_width=True, type="primary"):
-        try:
-            x_sym = sympify(variable_diff)
-            sympy_func = sympify(func_str_diff)
+                st.session_state.derivative_output = (derivative_inputs, (
+                    result, f"\\frac{{d}}{{d{x_sym}}} \\left( {sympy_func} \\right) = {derivative_expr}"
+                ))
+                st.session_state.history.append(f"d/d{x_sym}({func_str_diff}) at {eval_point} = {result}")
+                st.rerun()
 
-            derivative_expr = sympy_func.diff(x_sym)
-            result = derivative_expr.subs(x_sym, eval_point).evalf()
+            except (SympifyError, TokenError, SyntaxError, TypeError, ValueError, ZeroDivisionError, NameError) as e:
+                st.session_state.derivative_output = None
+                st.error(f"❌ Error in differentiation: {e}")
 
+        derivative_output = _stored_output('derivative_output', derivative_inputs)
+        if derivative_output:
+            result, latex = derivative_output
             st.success(f"✅ Derivative at x={eval_point}: {result}")
-            st.latex(f"\\frac{{d}}{{d{x_sym}}} \\left( {sympy_func} \\right) = {derivative_expr}")
-            st.session_state.history.append(f"d/d{x_sym}({func_str_diff}) at {eval_point} = {result}")
+            st.latex(latex)
+
+        st.markdown("**Evaluate on range**")
+        col_rng1, col_rng2, col_rng3 = st.columns(3)
+        range_start = col_rng1.number_input("Start (a)", value=0.0, format="%.4f", key="rng_start")
+        range_end = col_rng2.number_input("End (b)", value=1.0, format="%.4f", key="rng_end")
+        range_points = col_rng3.number_input("Points (N)", min_value=2, max_value=100000, value=100, step=1,
+                                             key="rng_points")
+
+        sweep_inputs = (func_str_diff, variable_diff, range_start, range_end, range_points)
+        if st.button("Evaluate Derivative on Range", use_container_width=True, type="primary"):
+            try:
+                vf = get_derivative_ufunc(func_str_diff, variable_diff)
+                xs = np.linspace(range_start, range_end, int(range_points))
+                ys = np.broadcast_to(vf(xs), xs.shape)
+
+                st.session_state.sweep_output = (sweep_inputs, {variable_diff: xs, f"d/d{variable_diff}": ys})
+                st.session_state.history.append(
+                    f"d/d{variable_diff}({func_str_diff}) on [{range_start}, {range_end}] with {int(range_points)} points"
+                )
+                st.rerun()
+
+            except (SympifyError, TokenError, SyntaxError, TypeError, ValueError, ZeroDivisionError, NameError) as e:
+                st.session_state.sweep_output = None
+                st.error(f"❌ Error in differentiation: {e}")
 
-        except (SympifyError, TypeError, ValueError) as e:
-            st.error(f"❌ Error in differentiation: {e}")
+        sweep_output = _stored_output('sweep_output', sweep_inputs)
+        if sweep_output:
+            st.line_chart(sweep_output, x=variable_diff)
+
+_calculus_fragment()
 
 # --- History Sidebar ---
-with st.sidebar:
+@st.fragment
+def _history_fragment():
+    """Sidebar history; clearing it reruns the whole app"""
     st.header("📋 History")
     if st.session_state.history:
-        for i, entry in enumerate(reversed(st.session_state.history)):
-            st.text_area(f"#{len(st.session_state.history) - i}", value=entry, height=75, disabled=True,
-                         key=f"hist_{i}")
+        n = len(st.session_state.history)
+        # A single widget for all entries instead of one text_area each
+        st.code("\n".join(f"#{n - i}: {entry}" for i, entry in enumerate(reversed(st.session_state.history))),
+                language=None)
 
         if st.button("🗑️ Clear History", use_container_width=True):
-            st.session_state.history = []
+            st.session_state.history.clear()
             st.rerun()
     else:
         st.info("No calculations yet.")
 
+with st.sidebar:
+    _history_fragment()
+
 # --- Instructions ---
 st.markdown("---")
 st.markdown("""